@@ -8,28 +8,99 @@ Mobile Control Tool API Server
 提供RESTful API接口，允许远程访问移动设备控制功能
 """
 
-from flask import Flask, request, jsonify, send_file
-from flask_cors import CORS
+from flask import Flask, Response, request, send_file
+import atexit
+import orjson
 import json
 import os
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from typing import Dict, Any
-from main import MobileControlTool
-
-# 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from main import ACTION_DISPATCH, MobileControlTool
+
+# 配置日志：日志记录进入内存队列，由后台线程格式化并写出，
+# 请求线程不再因stderr写入和日志锁而串行化
+_log_queue: "queue.Queue" = queue.Queue(-1)
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+_log_listener = QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+# main模块导入时已经给root logger装了同步的StreamHandler，这里直接替换成
+# QueueHandler。不走basicConfig：它会给QueueHandler附加默认formatter，
+# 导致记录在入队时被预格式化、监听线程再格式化一遍
+_root_logger = logging.getLogger()
+_root_logger.setLevel(logging.INFO)
+_root_logger.handlers[:] = [QueueHandler(_log_queue)]
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-CORS(app)  # 允许跨域请求
+
+# 允许跨域请求：该API完全开放，直接注入固定的CORS响应头，
+# 比flask-cors按请求反射Origin的中间件路径更轻量
+_CORS_STATIC = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET,POST,DELETE,OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
+
+@app.after_request
+def _apply_cors(response):
+    # Flask会为已注册路由自动应答OPTIONS预检，这里统一补上CORS头
+    response.headers.update(_CORS_STATIC)
+    return response
+
+# 使用orjson加速JSON序列化（大电话本/中文消息场景下明显降低编码开销）
+try:
+    from flask_orjson import OrjsonProvider
+
+    app.json = OrjsonProvider(app)
+except ImportError:  # 未安装flask-orjson时退回Flask默认的JSON实现
+    logger.info("flask-orjson未安装，使用默认JSON序列化")
 
 # 初始化工具
 tool = MobileControlTool()
 
+def _ojson(payload: Dict[str, Any], status: int = 200) -> Response:
+    """直接返回orjson编码的JSON响应，跳过jsonify的dict→str→bytes往返"""
+    return Response(orjson.dumps(payload), status=status, mimetype="application/json")
+
+class _BadRequestBody(Exception):
+    """请求体不是合法的JSON（客户端错误，应返回400而非500）"""
+
+# 非法JSON的固定响应体，构建一次
+_BAD_JSON_RESULT = {"success": False, "message": "请求体不是合法的JSON"}
+
+def _body() -> Dict[str, Any]:
+    """用orjson直接解析请求体，绕过get_json的mimetype检查和缓存包装"""
+    try:
+        return orjson.loads(request.get_data(cache=False) or b"{}")
+    except orjson.JSONDecodeError as e:
+        raise _BadRequestBody() from e
+
+def _as_int(value: Any) -> Any:
+    """整数快速路径：JSON里本来就是int的值原样返回，仅字符串等走int()解析"""
+    if value is None or type(value) is int:
+        return value
+    return int(value)
+
+def warmup() -> None:
+    """预热worker：预载电话本缓存并触发一次orjson编解码，
+    让首个真实请求不再支付冷启动成本（由gunicorn的post_worker_init调用）"""
+    try:
+        tool.phonebook_list()
+        orjson.loads(orjson.dumps({"warmup": True}))
+        logger.info("Worker预热完成")
+    except Exception as e:
+        logger.warning("Worker预热失败: %s", e)
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
-    return jsonify({
+    return _ojson({
         "status": "healthy",
         "service": "Mobile Control Tool API",
         "version": "1.0.0"
@@ -40,61 +111,24 @@ def mobile_control():
     """移动设备控制主接口"""
     try:
         # 获取请求数据
-        data = request.get_json()
+        data = _body()
         if not data:
-            return jsonify({
+            return _ojson({
                 "success": False,
                 "message": "请求体不能为空"
-            }), 400
+            }, 400)
 
         action = data.get('action')
         if not action:
-            return jsonify({
+            return _ojson({
                 "success": False,
                 "message": "缺少action参数"
-            }), 400
-
-        # 根据action执行相应操作
-        result = None
-
-        if action == "phonebook_list":
-            result = tool.phonebook_list()
-
-        elif action == "phonebook_add":
-            name = data.get('contact_name')
-            phone = data.get('phone_number')
-            alias = data.get('contact_alias', '')
-            result = tool.phonebook_add(name, phone, alias)
-
-        elif action == "phonebook_delete":
-            name = data.get('contact_name')
-            result = tool.phonebook_delete(name)
-
-        elif action == "call":
-            phone = data.get('phone_number')
-            result = tool.make_call(phone)
-
-        elif action == "sms":
-            phone = data.get('phone_number')
-            message = data.get('sms_message')
-            result = tool.send_sms(phone, message)
-
-        elif action == "volume":
-            level = data.get('volume_level')
-            if level is not None:
-                level = int(level)
-            result = tool.control_volume(level)
-
-        elif action == "brightness":
-            level = data.get('brightness_level')
-            if level is not None:
-                level = int(level)
-            result = tool.control_brightness(level)
-
-        elif action == "theme":
-            mode = data.get('theme_mode')
-            result = tool.control_theme(mode)
+            }, 400)
 
+        # 根据action执行相应操作（通过共享的分发表，避免逐一字符串比较）
+        handler = ACTION_DISPATCH.get(action)
+        if handler is not None:
+            result = handler(tool, data)
         else:
             result = {
                 "success": False,
@@ -102,146 +136,176 @@ def mobile_control():
             }
 
         # 记录操作日志
-        logger.info(f"执行操作: {action}, 结果: {result.get('success', False)}")
+        logger.info("执行操作: %s, 结果: %s", action, result.get('success', False))
 
-        return jsonify(result)
+        return _ojson(result)
 
+    except _BadRequestBody:
+        return _ojson(_BAD_JSON_RESULT, 400)
     except Exception as e:
-        logger.error(f"API调用异常: {e}")
-        return jsonify({
+        logger.error("API调用异常: %s", e)
+        return _ojson({
             "success": False,
             "message": f"服务器内部错误: {str(e)}"
-        }), 500
+        }, 500)
+
+# 电话本GET响应的字节级缓存：(数据版本, 序列化结果)。
+# Dify界面轮询场景下，数据未变时连续请求直接复用同一份编码好的字节
+_phonebook_response_cache = None
 
 @app.route('/api/phonebook', methods=['GET'])
 def get_phonebook():
     """获取电话本"""
+    global _phonebook_response_cache
     try:
-        result = tool.phonebook_list()
-        return jsonify(result)
+        version = tool.phonebook.current_version()
+        cached = _phonebook_response_cache
+        if cached is not None and cached[0] == version:
+            return Response(cached[1], mimetype="application/json")
+
+        body = orjson.dumps(tool.phonebook_list())
+        _phonebook_response_cache = (version, body)
+        return Response(body, mimetype="application/json")
     except Exception as e:
-        logger.error(f"获取电话本异常: {e}")
-        return jsonify({
+        logger.error("获取电话本异常: %s", e)
+        return _ojson({
             "success": False,
             "message": f"获取电话本失败: {str(e)}"
-        }), 500
+        }, 500)
+
+@app.route('/api/phonebook/stream', methods=['GET'])
+def stream_phonebook():
+    """流式获取电话本（NDJSON逐条输出，峰值内存与电话本大小无关）"""
+    def generate():
+        for contact in tool.phonebook.iter_contacts():
+            yield orjson.dumps(contact) + b"\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
 
 @app.route('/api/phonebook', methods=['POST'])
 def add_contact():
     """添加联系人"""
     try:
-        data = request.get_json()
+        data = _body()
         if not data:
-            return jsonify({
+            return _ojson({
                 "success": False,
                 "message": "请求体不能为空"
-            }), 400
+            }, 400)
 
         name = data.get('name')
         phone = data.get('phone')
         alias = data.get('alias', '')
 
         result = tool.phonebook_add(name, phone, alias)
-        return jsonify(result)
+        return _ojson(result)
+    except _BadRequestBody:
+        return _ojson(_BAD_JSON_RESULT, 400)
     except Exception as e:
-        logger.error(f"添加联系人异常: {e}")
-        return jsonify({
+        logger.error("添加联系人异常: %s", e)
+        return _ojson({
             "success": False,
             "message": f"添加联系人失败: {str(e)}"
-        }), 500
+        }, 500)
 
 @app.route('/api/phonebook/<name>', methods=['DELETE'])
 def delete_contact(name):
     """删除联系人"""
     try:
         result = tool.phonebook_delete(name)
-        return jsonify(result)
+        return _ojson(result)
     except Exception as e:
-        logger.error(f"删除联系人异常: {e}")
-        return jsonify({
+        logger.error("删除联系人异常: %s", e)
+        return _ojson({
             "success": False,
             "message": f"删除联系人失败: {str(e)}"
-        }), 500
+        }, 500)
 
 @app.route('/api/system/volume', methods=['POST'])
 def control_system_volume():
     """控制系统音量"""
     try:
-        data = request.get_json()
-        level = data.get('level')
-        if level is not None:
-            level = int(level)
+        data = _body()
+        level = _as_int(data.get('level'))
         result = tool.control_volume(level)
-        return jsonify(result)
+        return _ojson(result)
+    except _BadRequestBody:
+        return _ojson(_BAD_JSON_RESULT, 400)
     except Exception as e:
-        logger.error(f"控制音量异常: {e}")
-        return jsonify({
+        logger.error("控制音量异常: %s", e)
+        return _ojson({
             "success": False,
             "message": f"控制音量失败: {str(e)}"
-        }), 500
+        }, 500)
 
 @app.route('/api/system/brightness', methods=['POST'])
 def control_system_brightness():
     """控制屏幕亮度"""
     try:
-        data = request.get_json()
-        level = data.get('level')
-        if level is not None:
-            level = int(level)
+        data = _body()
+        level = _as_int(data.get('level'))
         result = tool.control_brightness(level)
-        return jsonify(result)
+        return _ojson(result)
+    except _BadRequestBody:
+        return _ojson(_BAD_JSON_RESULT, 400)
     except Exception as e:
-        logger.error(f"控制亮度异常: {e}")
-        return jsonify({
+        logger.error("控制亮度异常: %s", e)
+        return _ojson({
             "success": False,
             "message": f"控制亮度失败: {str(e)}"
-        }), 500
+        }, 500)
 
 @app.route('/api/system/theme', methods=['POST'])
 def control_system_theme():
     """控制系统主题"""
     try:
-        data = request.get_json()
+        data = _body()
         mode = data.get('mode')
         result = tool.control_theme(mode)
-        return jsonify(result)
+        return _ojson(result)
+    except _BadRequestBody:
+        return _ojson(_BAD_JSON_RESULT, 400)
     except Exception as e:
-        logger.error(f"控制主题异常: {e}")
-        return jsonify({
+        logger.error("控制主题异常: %s", e)
+        return _ojson({
             "success": False,
             "message": f"控制主题失败: {str(e)}"
-        }), 500
+        }, 500)
 
 @app.route('/api/communication/call', methods=['POST'])
 def make_phone_call():
     """拨打电话"""
     try:
-        data = request.get_json()
+        data = _body()
         phone = data.get('phone_number')
         result = tool.make_call(phone)
-        return jsonify(result)
+        return _ojson(result)
+    except _BadRequestBody:
+        return _ojson(_BAD_JSON_RESULT, 400)
     except Exception as e:
-        logger.error(f"拨打电话异常: {e}")
-        return jsonify({
+        logger.error("拨打电话异常: %s", e)
+        return _ojson({
             "success": False,
             "message": f"拨打电话失败: {str(e)}"
-        }), 500
+        }, 500)
 
 @app.route('/api/communication/sms', methods=['POST'])
 def send_sms_message():
     """发送短信"""
     try:
-        data = request.get_json()
+        data = _body()
         phone = data.get('phone_number')
         message = data.get('message')
         result = tool.send_sms(phone, message)
-        return jsonify(result)
+        return _ojson(result)
+    except _BadRequestBody:
+        return _ojson(_BAD_JSON_RESULT, 400)
     except Exception as e:
-        logger.error(f"发送短信异常: {e}")
-        return jsonify({
+        logger.error("发送短信异常: %s", e)
+        return _ojson({
             "success": False,
             "message": f"发送短信失败: {str(e)}"
-        }), 500
+        }, 500)
 
 @app.route('/download/tool', methods=['GET'])
 def download_tool():
@@ -251,10 +315,10 @@ def download_tool():
         tool_package_path = "mobile_control_tool.zip"
 
         if not os.path.exists(tool_package_path):
-            return jsonify({
+            return _ojson({
                 "success": False,
                 "message": "工具包不存在，请先运行打包脚本"
-            }), 404
+            }, 404)
 
         # 返回文件下载
         return send_file(
@@ -265,27 +329,27 @@ def download_tool():
         )
 
     except Exception as e:
-        logger.error(f"下载工具包异常: {e}")
-        return jsonify({
+        logger.error("下载工具包异常: %s", e)
+        return _ojson({
             "success": False,
             "message": f"下载失败: {str(e)}"
-        }), 500
+        }, 500)
 
 @app.errorhandler(404)
 def not_found(error):
     """处理404错误"""
-    return jsonify({
+    return _ojson({
         "success": False,
         "message": "接口不存在"
-    }), 404
+    }, 404)
 
 @app.errorhandler(500)
 def internal_error(error):
     """处理500错误"""
-    return jsonify({
+    return _ojson({
         "success": False,
         "message": "服务器内部错误"
-    }), 500
+    }, 500)
 
 if __name__ == '__main__':
     # 获取环境变量中的配置
@@ -298,4 +362,10 @@ if __name__ == '__main__':
     print(f"健康检查: http://{host}:{port}/health")
     print(f"API文档: http://{host}:{port}/api/mobile-control")
 
-    app.run(host=host, port=port, debug=debug)
+    if not debug:
+        # Werkzeug开发服务器是单线程、无keep-alive的，生产环境请使用gunicorn：
+        #   gunicorn -w 4 -k gthread --threads 4 --keep-alive 30 -b 0.0.0.0:5000 api_server:app
+        print("提示: 生产环境建议通过gunicorn启动（见run.sh）")
+
+    # threaded=True让阻塞在subprocess.run上的设备控制请求不会卡住其他请求
+    app.run(host=host, port=port, debug=debug, threaded=True)
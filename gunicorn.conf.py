@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""gunicorn配置：worker启动后立即预热，首个请求不付冷启动成本"""
+
+
+def post_worker_init(worker):
+    import api_server
+
+    api_server.warmup()
@@ -4,14 +4,21 @@
 
 from __future__ import annotations
 
+import atexit
 import json
 import logging
+import mmap
 import os
 import platform
+import re
+import select
 import subprocess
-from dataclasses import dataclass
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
 
 # ---------------------------------------------------------------------------
 # Logging configuration
@@ -22,6 +29,43 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ---------------------------------------------------------------------------
+# JSON backend: orjson when available, stdlib json otherwise
+# ---------------------------------------------------------------------------
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+    _JSONDecodeError = orjson.JSONDecodeError
+
+    def _json_dumps_pretty(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+    def _json_dumps_compact(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+except ImportError:  # Slower but dependency-free fallback
+
+    # Single decoder/encoder instances; json.loads/json.dumps construct a
+    # fresh scanner or encoder on every call.
+    _STDLIB_DECODER = json.JSONDecoder()
+    _STDLIB_ENCODER_PRETTY = json.JSONEncoder(ensure_ascii=False, indent=2)
+    _STDLIB_ENCODER_COMPACT = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    _JSONDecodeError = json.JSONDecodeError
+
+    def _json_loads(data: Any) -> Any:
+        if not isinstance(data, str):
+            data = bytes(data).decode("utf-8")
+        return _STDLIB_DECODER.decode(data)
+
+    def _json_dumps_pretty(obj: Any) -> bytes:
+        return _STDLIB_ENCODER_PRETTY.encode(obj).encode("utf-8")
+
+    def _json_dumps_compact(obj: Any) -> str:
+        return _STDLIB_ENCODER_COMPACT.encode(obj)
+
+
 # ---------------------------------------------------------------------------
 # Dify compatibility layer
 # ---------------------------------------------------------------------------
@@ -44,9 +88,18 @@ except ImportError:  # Local development fallback
 # ---------------------------------------------------------------------------
 # Data models and helpers
 # ---------------------------------------------------------------------------
-@dataclass
-class Contact:
-    """Represents a phonebook contact."""
+# First value token after a key: '{' means the modern nested format, '"' the
+# legacy {"name": "phone"} one. Lets _ensure_file detect the format without
+# decoding the whole file.
+_LEGACY_VALUE_RE = re.compile(rb':\s*([\{"])')
+
+
+class Contact(NamedTuple):
+    """Represents a phonebook contact.
+
+    A NamedTuple keeps instances immutable and __dict__-free while staying
+    compatible with the Python 3.9 base image (dataclass slots need 3.10+).
+    """
 
     name: str
     phone: str
@@ -57,290 +110,541 @@ class Contact:
 
 
 class PhonebookRepository:
-    """Persistence layer for phonebook data stored in JSON format."""
+    """Persistence layer for phonebook data stored in JSON format.
+
+    The in-memory dict is the source of truth: mutations update it directly
+    and disk writes are coalesced through a short flush timer, so bulk
+    add/delete sequences pay one serialization instead of one per call.
+    """
+
+    _FLUSH_DELAY = 0.05  # seconds to coalesce consecutive writes
+    _MMAP_THRESHOLD = 4096  # bytes; mmap the file for reads at or above this
 
     def __init__(self, file_path: Path):
         self.file_path = file_path
+        self._cache: Optional[Dict[str, Dict[str, str]]] = None
+        self._cache_stat = (-1, -1)  # (st_mtime_ns, st_size)
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._flush_timer: Optional[threading.Timer] = None
+        self._version = 0  # bumped on every reparse or mutation
+        atexit.register(self.flush)
         self._ensure_file()
 
     def _ensure_file(self) -> None:
+        # A crash between writing the tempfile and os.replace leaves the
+        # .tmp sibling behind; drop it so it never piles up.
+        self.file_path.with_name(self.file_path.name + ".tmp").unlink(missing_ok=True)
+
         if not self.file_path.exists():
             logger.debug("Creating phonebook file at %s", self.file_path)
             self._write({})
+            return
+
+        # Migrate the legacy {"name": "phone"} format once at startup. The
+        # raw-byte sniff identifies the format from the first value token, so
+        # modern files are never decoded just to be inspected.
+        raw = self.file_path.read_bytes()
+        match = _LEGACY_VALUE_RE.search(raw)
+        if match is None or match.group(1) != b'"':
+            return
+        try:
+            data = _json_loads(raw)
+        except _JSONDecodeError:
+            return  # corrupt file; _read resets it to empty on first access
+        logger.info("Migrating legacy phonebook format at %s", self.file_path)
+        self._write({name: {"phone": phone, "alias": ""} for name, phone in data.items()})
 
     def _read(self) -> Dict[str, Dict[str, str]]:
-        try:
-            with self.file_path.open("r", encoding="utf-8") as handle:
-                data = json.load(handle)
-        except (FileNotFoundError, json.JSONDecodeError):
-            logger.warning("Phonebook file missing or corrupt, resetting to empty")
-            return {}
-
-        # Backward compatibility with legacy format {"name": "phone"}
-        if data and isinstance(next(iter(data.values())), str):
-            logger.debug("Detected legacy phonebook format, converting")
-            data = {name: {"phone": phone, "alias": ""} for name, phone in data.items()}
-        return data
+        with self._lock:
+            # Pending in-memory changes are always newer than the file.
+            if self._dirty and self._cache is not None:
+                return self._cache
 
-    def _write(self, data: Dict[str, Dict[str, str]]) -> None:
-        with self.file_path.open("w", encoding="utf-8") as handle:
-            json.dump(data, handle, ensure_ascii=False, indent=2)
+            try:
+                stat = os.stat(self.file_path)
+            except FileNotFoundError:
+                logger.warning("Phonebook file missing, resetting to empty")
+                return {}
+
+            # Reuse the parsed dict unless the file changed on disk. Size is
+            # part of the key to catch writers that preserve the timestamp.
+            if self._cache is not None and (stat.st_mtime_ns, stat.st_size) == self._cache_stat:
+                return self._cache
+
+            # A fresh install holds just "{}"; skip the read and parse.
+            if stat.st_size <= 2:
+                self._cache = {}
+                self._cache_stat = (stat.st_mtime_ns, stat.st_size)
+                self._version += 1
+                return self._cache
+
+            try:
+                data = self._load_file(stat.st_size)
+            except (FileNotFoundError, _JSONDecodeError):
+                logger.warning("Phonebook file missing or corrupt, resetting to empty")
+                return {}
+
+            self._cache = data
+            self._cache_stat = (stat.st_mtime_ns, stat.st_size)
+            self._version += 1
+            return data
+
+    def _load_file(self, size: int) -> Dict[str, Dict[str, str]]:
+        # Large files are parsed straight out of the page cache via mmap,
+        # skipping the read() copy; below the threshold the extra syscalls
+        # cost more than the copy they save.
+        if size < self._MMAP_THRESHOLD:
+            return _json_loads(self.file_path.read_bytes())
+        with self.file_path.open("rb") as handle:
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return _json_loads(memoryview(mapped))
 
-    def list_contacts(self) -> List[Contact]:
+    def _write(self, data: Dict[str, Dict[str, str]]) -> None:
+        # Write to a sibling tempfile and rename so a crash mid-write can
+        # never leave a truncated phonebook behind.
+        tmp_path = self.file_path.with_name(self.file_path.name + ".tmp")
+        with tmp_path.open("wb") as handle:
+            handle.write(_json_dumps_pretty(data))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_path, self.file_path)
+        stat = os.stat(self.file_path)
+        self._cache = data
+        self._cache_stat = (stat.st_mtime_ns, stat.st_size)
+
+    def _commit(self, data: Dict[str, Dict[str, str]]) -> None:
+        """Swap in mutated data and schedule a coalesced flush to disk."""
+        with self._lock:
+            self._cache = data
+            self._dirty = True
+            self._version += 1
+            if self._flush_timer is None:
+                timer = threading.Timer(self._FLUSH_DELAY, self.flush)
+                timer.daemon = True
+                timer.start()
+                self._flush_timer = timer
+
+    def flush(self) -> None:
+        """Write pending in-memory changes to disk immediately."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._dirty and self._cache is not None:
+                self._write(self._cache)
+                self._dirty = False
+
+    @contextmanager
+    def bulk(self):
+        """Apply many mutations with one parse and one disk write.
+
+        Yields a mutable snapshot of the phonebook; on exit the whole batch
+        is committed as a single version bump and flushed immediately, so N
+        operations cost one serialization instead of N.
+        """
+        with self._lock:
+            phonebook = dict(self._read())
+            yield phonebook
+            self._commit(phonebook)
+            self.flush()
+
+    def current_version(self) -> int:
+        """Revalidate against the file and return the data version counter."""
+        self._read()
+        return self._version
+
+    def list_contacts(self) -> List[Dict[str, str]]:
+        # Build the response dicts directly; wrapping each row in a Contact
+        # only to call to_dict() would double the allocations per entry.
         phonebook = self._read()
-        return [Contact(name, info.get("phone", ""), info.get("alias", "")) for name, info in phonebook.items()]
+        return [
+            {"name": name, "phone": info.get("phone", ""), "alias": info.get("alias", "")}
+            for name, info in phonebook.items()
+        ]
+
+    def iter_contacts(self) -> Iterable[Dict[str, str]]:
+        """Yield contacts one dict at a time for streaming consumers."""
+        for name, info in self._read().items():
+            yield {"name": name, "phone": info.get("phone", ""), "alias": info.get("alias", "")}
 
     def add_contact(self, contact: Contact) -> bool:
-        phonebook = self._read()
-        if contact.name in phonebook:
-            return False
-        phonebook[contact.name] = {"phone": contact.phone, "alias": contact.alias}
-        self._write(phonebook)
+        # Mutate a shallow copy so readers keep a consistent snapshot, then
+        # swap it in atomically and let the flush timer batch the disk write.
+        with self._lock:
+            phonebook = dict(self._read())
+            if contact.name in phonebook:
+                return False
+            phonebook[contact.name] = {"phone": contact.phone, "alias": contact.alias}
+            self._commit(phonebook)
         return True
 
     def delete_contact(self, name: str) -> Optional[Contact]:
-        phonebook = self._read()
-        info = phonebook.pop(name, None)
-        if info is None:
-            return None
-        self._write(phonebook)
+        with self._lock:
+            phonebook = dict(self._read())
+            info = phonebook.pop(name, None)
+            if info is None:
+                return None
+            self._commit(phonebook)
         return Contact(name, info.get("phone", ""), info.get("alias", ""))
 
 
+# AppleScript sources are fixed at module load so every call reuses the same
+# interned string objects instead of reassembling them.
+_APPLESCRIPT_DARK_MODE_ON = 'tell application "System Events" to tell appearance preferences to set dark mode to true'
+_APPLESCRIPT_DARK_MODE_OFF = 'tell application "System Events" to tell appearance preferences to set dark mode to false'
+
+# The host platform cannot change while the process runs; resolve it once
+# instead of calling platform.system() per controller instance.
+_DEFAULT_SYSTEM = platform.system().lower()
+
+# Theme argv tuples resolved by (system, mode). Built once at import so
+# set_theme only looks up precomputed commands instead of rebuilding
+# list literals per call.
+_THEME_CMDS = {
+    ("linux", "dark"): (
+        ("gsettings", "set", "org.gnome.desktop.interface", "gtk-theme", "Adwaita-dark"),
+    ),
+    ("linux", "light"): (
+        ("gsettings", "set", "org.gnome.desktop.interface", "gtk-theme", "Adwaita"),
+    ),
+}
+
+# Windows flips AppsUseLightTheme and SystemUsesLightTheme together via a
+# single "reg import" instead of two "reg add" spawns. The .reg sources are
+# rendered to a cached tempfile on first use.
+_WIN_THEME_REG_SOURCES = {
+    "dark": (
+        "Windows Registry Editor Version 5.00\r\n\r\n"
+        "[HKEY_CURRENT_USER\\SOFTWARE\\Microsoft\\Windows\\CurrentVersion\\Themes\\Personalize]\r\n"
+        '"AppsUseLightTheme"=dword:00000000\r\n'
+        '"SystemUsesLightTheme"=dword:00000000\r\n'
+    ),
+    "light": (
+        "Windows Registry Editor Version 5.00\r\n\r\n"
+        "[HKEY_CURRENT_USER\\SOFTWARE\\Microsoft\\Windows\\CurrentVersion\\Themes\\Personalize]\r\n"
+        '"AppsUseLightTheme"=dword:00000001\r\n'
+        '"SystemUsesLightTheme"=dword:00000001\r\n'
+    ),
+}
+
+
 class SystemController:
     """Encapsulates system level operations for different platforms."""
 
+    _SUPPORTED_SYSTEMS = ("darwin", "windows", "linux")
+
     def __init__(self, system_name: Optional[str] = None):
-        self.system = (system_name or platform.system()).lower()
+        self.system = system_name.lower() if system_name else _DEFAULT_SYSTEM
+        self._osascript_proc: Optional[subprocess.Popen] = None
+
+        # The platform cannot change at runtime, so resolve the
+        # platform-specific implementation of each operation once instead of
+        # string-comparing self.system on every call.
+        if self.system not in self._SUPPORTED_SYSTEMS:
+            logger.warning("不支持的操作系统: %s，所有设备控制操作都将失败", self.system)
+        suffix = self.system if self.system in self._SUPPORTED_SYSTEMS else "unsupported"
+        self._dial_impl = getattr(self, f"_dial_{suffix}", self._unsupported)
+        self._sms_impl = getattr(self, f"_sms_{suffix}", self._unsupported)
+        self._volume_impl = getattr(self, f"_volume_{suffix}", self._unsupported)
+        self._brightness_impl = getattr(self, f"_brightness_{suffix}", self._unsupported)
+
+    def _unsupported(self, *args: Any) -> None:
+        raise ValueError(f"不支持的操作系统: {self.system}")
+
+    @staticmethod
+    def _open_windows_uri(uri: str) -> None:
+        """Open a URI via the Windows shell association.
+
+        os.startfile talks to the shell directly, avoiding the extra cmd.exe
+        process that 'cmd /c start' spawns per call. The cmd fallback keeps
+        the Windows code path exercisable from other platforms.
+        """
+        if hasattr(os, "startfile"):
+            os.startfile(uri)  # type: ignore[attr-defined]
+        else:
+            subprocess.run(["cmd", "/c", "start", "", uri], check=True)
+
+    # AppleScript helper -----------------------------------------------------
+    _OSA_TIMEOUT = 5.0  # seconds to wait for the interpreter's reply
+    _OSA_MARKER = "__osascript_ok__"  # echoed by the interpreter after each statement
+
+    def _run_osascript(self, script: str) -> None:
+        """Run one AppleScript line via a persistent ``osascript -i`` child.
+
+        Spawning a fresh osascript costs ~50-100 ms per call, so a single
+        interactive interpreter is kept alive and fed over stdin. Every
+        statement is chased by a marker literal: seeing its echo (and a
+        silent stderr) within the timeout is the only success path. A
+        missing marker, stderr output, or a dead child tears the
+        interpreter down and repeats the statement through the one-shot
+        run, so failures still surface as CalledProcessError.
+        """
+        proc = self._osascript_proc
+        if proc is None or proc.poll() is not None:
+            proc = self._spawn_osascript()
+
+        if proc is not None and self._osascript_exchange(proc, script):
+            return
+
+        subprocess.run(("osascript", "-e", script), check=True)
+
+    def _spawn_osascript(self) -> Optional[subprocess.Popen]:
+        try:
+            proc = subprocess.Popen(
+                ["osascript", "-i"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        except OSError:
+            self._osascript_proc = None
+            return None
+        # Non-blocking pipes let the reply loop poll stdout and stderr
+        # together instead of hanging on a readline that may never come.
+        os.set_blocking(proc.stdout.fileno(), False)
+        os.set_blocking(proc.stderr.fileno(), False)
+        atexit.register(proc.terminate)
+        self._osascript_proc = proc
+        return proc
+
+    def _osascript_exchange(self, proc: subprocess.Popen, script: str) -> bool:
+        """Send one statement; True only on an unambiguous success."""
+        try:
+            proc.stdin.write(f'{script}\n"{self._OSA_MARKER}"\n'.encode())
+            proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self._reset_osascript(proc)
+            return False
+
+        marker = self._OSA_MARKER.encode()
+        stdout_data = b""
+        stderr_data = b""
+        deadline = time.monotonic() + self._OSA_TIMEOUT
+        while marker not in stdout_data:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or proc.poll() is not None:
+                logger.debug("Persistent osascript unresponsive, falling back to one-shot run")
+                self._reset_osascript(proc)
+                return False
+            readable, _, _ = select.select([proc.stdout, proc.stderr], [], [], remaining)
+            for pipe in readable:
+                if pipe is proc.stderr:
+                    stderr_data += pipe.read() or b""
+                else:
+                    stdout_data += pipe.read() or b""
+
+        # One last zero-timeout drain so an error printed just before the
+        # marker echo is not missed.
+        readable, _, _ = select.select([proc.stderr], [], [], 0)
+        if readable:
+            stderr_data += proc.stderr.read() or b""
+
+        if stderr_data:
+            # AppleScript errors (e.g. automation permission denied) land on
+            # stderr; rerun one-shot so the failure raises CalledProcessError.
+            logger.debug(
+                "Persistent osascript reported an error, falling back: %s",
+                stderr_data.decode(errors="replace").strip(),
+            )
+            self._reset_osascript(proc)
+            return False
+        return True
+
+    def _reset_osascript(self, proc: subprocess.Popen) -> None:
+        self._osascript_proc = None
+        if proc.poll() is None:
+            proc.terminate()
 
     # Phone & SMS ------------------------------------------------------------
     def dial(self, phone_number: str) -> str:
         self._require_value(phone_number, "电话号码不能为空")
+        self._dial_impl(phone_number)
+        return f"正在拨打: {phone_number}"
 
-        if self.system == "darwin":
-            subprocess.run(["open", f"tel:{phone_number}"], check=True)
-        elif self.system == "windows":
-            subprocess.run(["start", f"tel:{phone_number}"], shell=True, check=True)
-        elif self.system == "linux":
-            subprocess.run(["xdg-open", f"tel:{phone_number}"], check=True)
-        else:
-            raise ValueError(f"不支持的操作系统: {self.system}")
+    def _dial_darwin(self, phone_number: str) -> None:
+        subprocess.run(["open", f"tel:{phone_number}"], check=True)
 
-        return f"正在拨打: {phone_number}"
+    def _dial_windows(self, phone_number: str) -> None:
+        self._open_windows_uri(f"tel:{phone_number}")
+
+    def _dial_linux(self, phone_number: str) -> None:
+        subprocess.run(["xdg-open", f"tel:{phone_number}"], check=True)
 
     def send_sms(self, phone_number: str, message: str) -> str:
         self._require_value(phone_number, "电话号码不能为空")
         self._require_value(message, "短信内容不能为空")
+        self._sms_impl(phone_number, message)
 
-        if self.system == "darwin":
-            subprocess.run(["open", f"sms:{phone_number}&body={message}"], check=True)
-        elif self.system == "windows":
-            subprocess.run(["start", f"sms:{phone_number}?body={message}"], shell=True, check=True)
-        elif self.system == "linux":
-            subprocess.run(["xdg-open", f"sms:{phone_number}?body={message}"], check=True)
-        else:
-            raise ValueError(f"不支持的操作系统: {self.system}")
-
-        preview = message[:50]
-        if len(message) > 50:
-            preview += "..."
+        preview = (message[:50] + "...") if len(message) > 50 else message
         return f"正在发送短信到 {phone_number}: {preview}"
 
+    def _sms_darwin(self, phone_number: str, message: str) -> None:
+        subprocess.run(["open", f"sms:{phone_number}&body={message}"], check=True)
+
+    def _sms_windows(self, phone_number: str, message: str) -> None:
+        self._open_windows_uri(f"sms:{phone_number}?body={message}")
+
+    def _sms_linux(self, phone_number: str, message: str) -> None:
+        subprocess.run(["xdg-open", f"sms:{phone_number}?body={message}"], check=True)
+
     # Volume ----------------------------------------------------------------
     def set_volume(self, level: int) -> str:
         self._validate_percentage(level, "音量等级必须是0-100之间的整数")
+        self._volume_impl(level)
+        return f"音量已设置为 {level}%"
 
-        if self.system == "darwin":
-            volume_percent = int((level / 100) * 7)
-            subprocess.run(["osascript", "-e", f"set volume output volume {volume_percent}"], check=True)
-        elif self.system == "windows":
-            try:
-                subprocess.run(["nircmd.exe", "setsysvolume", str(int((level / 100) * 65535))], check=True)
-            except FileNotFoundError as exc:
-                raise FileNotFoundError("需要安装nircmd工具来控制Windows音量") from exc
-        elif self.system == "linux":
-            try:
-                subprocess.run(["amixer", "sset", "Master", f"{level}%"], check=True)
-            except FileNotFoundError as exc:
-                raise FileNotFoundError("需要安装alsa-utils来控制Linux音量") from exc
-        else:
-            raise ValueError(f"不支持的操作系统: {self.system}")
+    def _volume_darwin(self, level: int) -> None:
+        self._run_osascript(f"set volume output volume {self._scale(level, 7)}")
 
-        return f"音量已设置为 {level}%"
+    def _volume_windows(self, level: int) -> None:
+        try:
+            subprocess.run(["nircmd.exe", "setsysvolume", str(self._scale(level, 65535))], check=True)
+        except FileNotFoundError as exc:
+            raise FileNotFoundError("需要安装nircmd工具来控制Windows音量") from exc
+
+    def _volume_linux(self, level: int) -> None:
+        try:
+            subprocess.run(["amixer", "sset", "Master", f"{level}%"], check=True)
+        except FileNotFoundError as exc:
+            raise FileNotFoundError("需要安装alsa-utils来控制Linux音量") from exc
 
     # Brightness ------------------------------------------------------------
     def set_brightness(self, level: int) -> str:
         self._validate_percentage(level, "亮度等级必须是0-100之间的整数")
+        self._brightness_impl(level)
+        return f"亮度已设置为 {level}%"
 
-        if self.system == "darwin":
-            try:
-                subprocess.run(["brightness", str(level / 100)], check=True)
-            except FileNotFoundError as exc:
-                raise FileNotFoundError("需要安装brightness工具来控制macOS亮度") from exc
-        elif self.system == "windows":
-            try:
-                subprocess.run(
-                    [
-                        "powershell",
-                        "-Command",
-                        f"(Get-WmiObject -Namespace root/WMI -Class WmiMonitorBrightnessMethods).WmiSetBrightness(1, {level})",
-                    ],
-                    check=True,
-                )
-            except subprocess.CalledProcessError as exc:
-                raise PermissionError("Windows亮度控制需要管理员权限或特定工具") from exc
-        elif self.system == "linux":
-            try:
-                subprocess.run(["brightnessctl", "set", f"{level}%"], check=True)
-            except FileNotFoundError as exc:
-                raise FileNotFoundError("需要安装brightnessctl来控制Linux亮度") from exc
-        else:
-            raise ValueError(f"不支持的操作系统: {self.system}")
+    def _brightness_darwin(self, level: int) -> None:
+        try:
+            subprocess.run(["brightness", str(level / 100)], check=True)
+        except FileNotFoundError as exc:
+            raise FileNotFoundError("需要安装brightness工具来控制macOS亮度") from exc
 
-        return f"亮度已设置为 {level}%"
+    def _brightness_windows(self, level: int) -> None:
+        try:
+            subprocess.run(
+                [
+                    "powershell",
+                    "-Command",
+                    f"(Get-WmiObject -Namespace root/WMI -Class WmiMonitorBrightnessMethods).WmiSetBrightness(1, {level})",
+                ],
+                check=True,
+            )
+        except subprocess.CalledProcessError as exc:
+            raise PermissionError("Windows亮度控制需要管理员权限或特定工具") from exc
+
+    def _brightness_linux(self, level: int) -> None:
+        try:
+            subprocess.run(["brightnessctl", "set", f"{level}%"], check=True)
+        except FileNotFoundError as exc:
+            raise FileNotFoundError("需要安装brightnessctl来控制Linux亮度") from exc
 
     # Theme -----------------------------------------------------------------
+    # AppleScript lines fed to the persistent osascript interpreter.
+    _THEME_SCRIPTS = {
+        "dark": _APPLESCRIPT_DARK_MODE_ON,
+        "light": _APPLESCRIPT_DARK_MODE_OFF,
+    }
+
+    _SYSTEM_LABELS = {"darwin": "macOS", "windows": "Windows", "linux": "Linux"}
+
     def set_theme(self, mode: str) -> str:
         valid_modes = ["light", "dark", "auto"]
         if mode not in valid_modes:
             raise ValueError(f"无效的主题模式，可选值: {', '.join(valid_modes)}")
 
+        if self.system not in self._SYSTEM_LABELS:
+            raise ValueError(f"不支持的操作系统: {self.system}")
+        if mode == "auto":
+            raise NotImplementedError(f"{self._SYSTEM_LABELS[self.system]}自动主题模式暂不支持")
+
         if self.system == "darwin":
-            if mode == "dark":
-                subprocess.run(
-                    [
-                        "osascript",
-                        "-e",
-                        'tell application "System Events" to tell appearance preferences to set dark mode to true',
-                    ],
-                    check=True,
-                )
-            elif mode == "light":
-                subprocess.run(
-                    [
-                        "osascript",
-                        "-e",
-                        'tell application "System Events" to tell appearance preferences to set dark mode to false',
-                    ],
-                    check=True,
-                )
-            else:
-                raise NotImplementedError("macOS自动主题模式暂不支持")
+            self._run_osascript(self._THEME_SCRIPTS[mode])
         elif self.system == "windows":
-            if mode == "dark":
-                subprocess.run(
-                    [
-                        "reg",
-                        "add",
-                        "HKCU\\SOFTWARE\\Microsoft\\Windows\\CurrentVersion\\Themes\\Personalize",
-                        "/v",
-                        "AppsUseLightTheme",
-                        "/t",
-                        "REG_DWORD",
-                        "/d",
-                        "0",
-                        "/f",
-                    ],
-                    check=True,
-                )
-                subprocess.run(
-                    [
-                        "reg",
-                        "add",
-                        "HKCU\\SOFTWARE\\Microsoft\\Windows\\CurrentVersion\\Themes\\Personalize",
-                        "/v",
-                        "SystemUsesLightTheme",
-                        "/t",
-                        "REG_DWORD",
-                        "/d",
-                        "0",
-                        "/f",
-                    ],
-                    check=True,
-                )
-            elif mode == "light":
-                subprocess.run(
-                    [
-                        "reg",
-                        "add",
-                        "HKCU\\SOFTWARE\\Microsoft\\Windows\\CurrentVersion\\Themes\\Personalize",
-                        "/v",
-                        "AppsUseLightTheme",
-                        "/t",
-                        "REG_DWORD",
-                        "/d",
-                        "1",
-                        "/f",
-                    ],
-                    check=True,
-                )
-                subprocess.run(
-                    [
-                        "reg",
-                        "add",
-                        "HKCU\\SOFTWARE\\Microsoft\\Windows\\CurrentVersion\\Themes\\Personalize",
-                        "/v",
-                        "SystemUsesLightTheme",
-                        "/t",
-                        "REG_DWORD",
-                        "/d",
-                        "1",
-                        "/f",
-                    ],
-                    check=True,
-                )
-            else:
-                raise NotImplementedError("Windows自动主题模式暂不支持")
-        elif self.system == "linux":
+            # One reg import sets both registry values in a single spawn.
+            subprocess.run(("reg", "import", self._win_theme_reg_file(mode)), check=True)
+        else:
             try:
-                if mode == "dark":
-                    subprocess.run(["gsettings", "set", "org.gnome.desktop.interface", "gtk-theme", "Adwaita-dark"], check=True)
-                elif mode == "light":
-                    subprocess.run(["gsettings", "set", "org.gnome.desktop.interface", "gtk-theme", "Adwaita"], check=True)
-                else:
-                    raise NotImplementedError("Linux自动主题模式暂不支持")
+                for command in _THEME_CMDS[(self.system, mode)]:
+                    subprocess.run(command, check=True)
             except FileNotFoundError as exc:
                 raise FileNotFoundError("需要GNOME桌面环境或安装gsettings来控制主题") from exc
-        else:
-            raise ValueError(f"不支持的操作系统: {self.system}")
 
         return f"主题已设置为: {mode}"
 
+    # Cached paths of rendered .reg files, shared by all controllers.
+    _win_theme_reg_paths: Dict[str, str] = {}
+
+    @classmethod
+    def _win_theme_reg_file(cls, mode: str) -> str:
+        """Render the .reg file for a theme mode once and reuse its path."""
+        path = cls._win_theme_reg_paths.get(mode)
+        if path is None:
+            path = os.path.join(tempfile.gettempdir(), f"mobile_control_theme_{mode}.reg")
+            # newline="" keeps the literal CRLF endings; the default newline
+            # translation on Windows would corrupt them into CR CR LF and
+            # reg import rejects the file.
+            with open(path, "w", encoding="utf-16", newline="") as handle:
+                handle.write(_WIN_THEME_REG_SOURCES[mode])
+            cls._win_theme_reg_paths[mode] = path
+        return path
+
     # Validators ------------------------------------------------------------
+    @staticmethod
+    def _scale(level: int, maximum: int) -> int:
+        """Scale a 0-100 percentage onto 0..maximum with pure integer math."""
+        return (level * maximum) // 100
+
     @staticmethod
     def _require_value(value: Optional[str], error_message: str) -> None:
         if not value:
             raise ValueError(error_message)
 
     @staticmethod
-    def _validate_percentage(value: Any, error_message: str) -> None:
-        if not isinstance(value, int) or not (0 <= value <= 100):
+    def _validate_percentage(value: int, error_message: str) -> None:
+        # Callers int()-coerce before validating, so a bare range check is
+        # enough; a mis-typed value fails the comparison with TypeError,
+        # which the control_* wrappers already report.
+        if not 0 <= value <= 100:
             raise ValueError(error_message)
 
 
 # ---------------------------------------------------------------------------
 # Tool implementation
 # ---------------------------------------------------------------------------
+# Constant responses built once instead of per call.
+_EMPTY_PHONEBOOK_RESULT: Dict[str, Any] = {"success": True, "message": "电话本为空", "data": []}
+
+
 class MobileControlTool(BuiltinTool):
     """Mobile device control tool compatible with Dify's tool interface."""
 
     def __init__(self, phonebook_path: Optional[Path] = None, system_controller: Optional[SystemController] = None):
         self.phonebook = PhonebookRepository(phonebook_path or Path("phonebook.json"))
         self.system_controller = system_controller or SystemController()
+        self._list_cache: Optional[tuple] = None  # (repository version, response dict)
 
     # Phonebook -------------------------------------------------------------
     def phonebook_list(self) -> Dict[str, Any]:
         try:
+            # Identical responses are served from cache until the data changes.
+            version = self.phonebook.current_version()
+            if self._list_cache is not None and version == self._list_cache[0]:
+                return self._list_cache[1]
+
             contacts = self.phonebook.list_contacts()
             if not contacts:
-                return {"success": True, "message": "电话本为空", "data": []}
-
-            contact_dicts = [contact.to_dict() for contact in contacts]
-            return {
-                "success": True,
-                "message": f"找到 {len(contact_dicts)} 个联系人",
-                "data": contact_dicts,
-            }
+                result = _EMPTY_PHONEBOOK_RESULT
+            else:
+                result = {
+                    "success": True,
+                    "message": f"找到 {len(contacts)} 个联系人",
+                    "data": contacts,
+                }
+
+            self._list_cache = (version, result)
+            return result
         except Exception as exc:  # pragma: no cover - defensive
             logger.error("查看电话本失败: %s", exc)
             return {"success": False, "message": f"查看电话本失败: {exc}", "data": []}
@@ -442,41 +746,49 @@ class MobileControlTool(BuiltinTool):
     def _invoke(self, user_id: str, tool_parameters: Dict[str, Any]) -> List[ToolInvokeMessage]:
         try:
             action = tool_parameters.get("action")
-            result: Dict[str, Any]
-
-            if action == "phonebook_list":
-                result = self.phonebook_list()
-            elif action == "phonebook_add":
-                result = self.phonebook_add(
-                    tool_parameters.get("contact_name"),
-                    tool_parameters.get("phone_number"),
-                    tool_parameters.get("contact_alias", ""),
-                )
-            elif action == "phonebook_delete":
-                result = self.phonebook_delete(tool_parameters.get("contact_name"))
-            elif action == "call":
-                result = self.make_call(tool_parameters.get("phone_number"))
-            elif action == "sms":
-                result = self.send_sms(
-                    tool_parameters.get("phone_number"),
-                    tool_parameters.get("sms_message"),
-                )
-            elif action == "volume":
-                level = tool_parameters.get("volume_level")
-                result = self.control_volume(int(level) if level is not None else None)
-            elif action == "brightness":
-                level = tool_parameters.get("brightness_level")
-                result = self.control_brightness(int(level) if level is not None else None)
-            elif action == "theme":
-                result = self.control_theme(tool_parameters.get("theme_mode"))
+
+            handler = ACTION_DISPATCH.get(action)
+            if handler is None:
+                result: Dict[str, Any] = {"success": False, "message": f"未知操作: {action}"}
             else:
-                result = {"success": False, "message": f"未知操作: {action}"}
+                result = handler(self, tool_parameters)
 
-            return [ToolInvokeMessage.Text(json.dumps(result, ensure_ascii=False, indent=2))]
+            return [ToolInvokeMessage.Text(_json_dumps_compact(result))]
         except Exception as exc:
             logger.error("Dify工具调用异常: %s", exc)
             error_payload = {"success": False, "message": f"工具调用失败: {exc}"}
-            return [ToolInvokeMessage.Text(json.dumps(error_payload, ensure_ascii=False, indent=2))]
+            return [ToolInvokeMessage.Text(_json_dumps_compact(error_payload))]
+
+
+# ---------------------------------------------------------------------------
+# Action dispatch table
+# ---------------------------------------------------------------------------
+def _optional_int(value: Optional[Any]) -> Optional[int]:
+    # Fast path: JSON integers arrive as int already; only strings need parsing.
+    if value is None or type(value) is int:
+        return value
+    return int(value)
+
+
+# Maps action names to handlers so callers resolve actions with a single dict
+# lookup instead of an if/elif chain. Shared with the API server.
+ACTION_DISPATCH: Dict[str, Any] = {
+    "phonebook_list": lambda tool, params: tool.phonebook_list(),
+    "phonebook_add": lambda tool, params: tool.phonebook_add(
+        params.get("contact_name"),
+        params.get("phone_number"),
+        params.get("contact_alias", ""),
+    ),
+    "phonebook_delete": lambda tool, params: tool.phonebook_delete(params.get("contact_name")),
+    "call": lambda tool, params: tool.make_call(params.get("phone_number")),
+    "sms": lambda tool, params: tool.send_sms(
+        params.get("phone_number"),
+        params.get("sms_message"),
+    ),
+    "volume": lambda tool, params: tool.control_volume(_optional_int(params.get("volume_level"))),
+    "brightness": lambda tool, params: tool.control_brightness(_optional_int(params.get("brightness_level"))),
+    "theme": lambda tool, params: tool.control_theme(params.get("theme_mode")),
+}
 
 
 # ---------------------------------------------------------------------------
@@ -485,62 +797,50 @@ class MobileControlTool(BuiltinTool):
 def parse_cli_arguments(arguments: Iterable[str]) -> Dict[str, Any]:
     parsed: Dict[str, Any] = {}
     for arg in arguments:
-        if "=" in arg:
-            key, value = arg.split("=", 1)
+        # partition scans once and returns a tuple, replacing the separate
+        # "in" check plus split() list allocation.
+        key, sep, value = arg.partition("=")
+        if sep:
             parsed[key] = value
         else:
             parsed["action"] = arg
     return parsed
 
 
+# Pre-serialized CLI error payloads (constant content, built once).
+_CLI_MISSING_ARGS = _json_dumps_compact({"error": "缺少参数。请提供action参数。"})
+_CLI_MISSING_ACTION = _json_dumps_compact({"error": "缺少action参数。"})
+
+
 def main() -> None:
     import sys
 
     if len(sys.argv) < 2:
-        print(json.dumps({"error": "缺少参数。请提供action参数。"}, ensure_ascii=False))
+        print(_CLI_MISSING_ARGS)
         return
 
     args = parse_cli_arguments(sys.argv[1:])
     action = args.get("action")
     if not action:
-        print(json.dumps({"error": "缺少action参数。"}, ensure_ascii=False))
+        print(_CLI_MISSING_ACTION)
         return
 
     tool = MobileControlTool()
 
     try:
-        if action == "phonebook_list":
-            result = tool.phonebook_list()
-        elif action == "phonebook_add":
-            result = tool.phonebook_add(
-                args.get("contact_name"),
-                args.get("phone_number"),
-                args.get("contact_alias", ""),
-            )
-        elif action == "phonebook_delete":
-            result = tool.phonebook_delete(args.get("contact_name"))
-        elif action == "call":
-            result = tool.make_call(args.get("phone_number"))
-        elif action == "sms":
-            result = tool.send_sms(
-                args.get("phone_number"),
-                args.get("sms_message"),
-            )
-        elif action == "volume":
-            level = args.get("volume_level")
-            result = tool.control_volume(int(level) if level is not None else None)
-        elif action == "brightness":
-            level = args.get("brightness_level")
-            result = tool.control_brightness(int(level) if level is not None else None)
-        elif action == "theme":
-            result = tool.control_theme(args.get("theme_mode"))
-        else:
+        # Same dispatch table as _invoke and the API server.
+        handler = ACTION_DISPATCH.get(action)
+        if handler is None:
             result = {"success": False, "message": f"未知操作: {action}"}
+        else:
+            result = handler(tool, args)
 
-        print(json.dumps(result, ensure_ascii=False))
+        # The CLI is read by humans, so this is the one place that pays
+        # for indentation; _invoke and the API stay compact.
+        print(_json_dumps_pretty(result).decode("utf-8"))
     except Exception as exc:  # pragma: no cover - defensive logging
         logger.error("执行操作失败: %s", exc)
-        print(json.dumps({"success": False, "message": f"执行操作失败: {exc}"}, ensure_ascii=False))
+        print(_json_dumps_pretty({"success": False, "message": f"执行操作失败: {exc}"}).decode("utf-8"))
 
 
 if __name__ == "__main__":
@@ -71,4 +71,10 @@ echo ""
 echo "按 Ctrl+C 停止服务器"
 echo ""
 
-python3 api_server.py
+# 优先使用gunicorn（多worker + keep-alive），未安装或调试模式时退回开发服务器
+if [ "$DEBUG" != "true" ] && command -v gunicorn &> /dev/null; then
+    WORKERS=${WORKERS:-$(nproc 2>/dev/null || echo 4)}
+    exec gunicorn -w "$WORKERS" -k gthread --threads 4 --keep-alive 30 -b "$HOST:$PORT" api_server:app
+else
+    python3 api_server.py
+fi
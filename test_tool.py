@@ -6,212 +6,303 @@ Dify工具测试脚本
 验证工具配置和功能是否正常
 """
 
-import json
+import functools
+import importlib.util
+import io
 import os
+import re
+from contextlib import contextmanager, suppress
 try:
     import yaml  # type: ignore
+    try:
+        # libyaml承载的C解析器，解析速度远高于纯Python的SafeLoader
+        from yaml import CSafeLoader as _YamlLoader  # type: ignore
+    except ImportError:  # pragma: no cover - PyYAML built without libyaml
+        from yaml import SafeLoader as _YamlLoader  # type: ignore
+
+    def _yaml_load(stream):
+        return yaml.load(stream, Loader=_YamlLoader)
 except ModuleNotFoundError:  # pragma: no cover - fallback for offline environments
     import json
-    from types import SimpleNamespace
 
-    def _load_json(stream):
+    def _yaml_load(stream):
         content = stream.read() if hasattr(stream, "read") else str(stream)
         return json.loads(content)
-
-    yaml = SimpleNamespace(safe_load=_load_json)
 import sys
 
+# 解析结果缓存：path -> ((mtime_ns, size), config)。
+# 同一进程内重复加载同一份YAML时直接复用解析结果，文件变化后自动失效
+_YAML_CACHE = {}
+
+def _cached_yaml_load(path):
+    """加载YAML文件，未变化时复用缓存的解析结果（调用方不应修改返回值）"""
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _YAML_CACHE.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        config = _yaml_load(f)
+    _YAML_CACHE[path] = (key, config)
+    return config
+
+# 必需字段集合：一次frozenset差集找出全部缺失项，替代逐字段的in检查
+_REQUIRED_FIELDS = frozenset({'openapi', 'info', 'paths'})
+_REQUIRED_INFO_FIELDS = frozenset({'title', 'description', 'version'})
+_REQUIRED_SCHEMAS = frozenset({'MobileControlRequest', 'MobileControlResponse'})
+
+# 高频查找的字段名显式intern，dict查找的首次比较可走指针相等快路径
+_OPERATION_ID = sys.intern('operationId')
+_RESPONSES = sys.intern('responses')
+
+# 每个HTTP方法定义的必需字段，逐方法做一次差集即可找出全部缺失项
+_REQUIRED_METHOD_FIELDS = frozenset({_OPERATION_ID, _RESPONSES})
+
+# 工具类必须提供的方法名，同样intern后供属性查找使用
+_REQUIRED_TOOL_METHODS = frozenset(sys.intern(name) for name in (
+    'phonebook_list',
+    'phonebook_add',
+    'phonebook_delete',
+    'make_call',
+    'send_sms',
+    'control_volume',
+    'control_brightness',
+    'control_theme',
+    '_invoke',  # Dify工具必需的方法
+))
+
+# 顶层字段的声明式类型校验表：(字段, 期望类型, 是否要求非空, 错误信息)。
+# 导入时构建一次，校验循环只做isinstance和真值判断
+_TOP_LEVEL_SPEC = (
+    ('openapi', str, False, '❌ openapi字段必须是字符串'),
+    ('info', dict, False, '❌ info字段必须是对象'),
+    ('paths', dict, True, '❌ paths必须是非空对象'),
+)
+
+class _Reporter:
+    """缓冲测试输出，每个测试函数结束时一次写出，替代逐条print的系统调用"""
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+
+    def write(self, message):
+        self._buffer.write(message)
+        self._buffer.write('\n')
+
+    def flush(self):
+        sys.stdout.write(self._buffer.getvalue())
+        sys.stdout.flush()
+        self._buffer = io.StringIO()
+
+_reporter = _Reporter()
+
+def _mro_names(cls):
+    """沿MRO合并各基类__dict__的键：一次遍历拿到类的全部属性名"""
+    names = set()
+    for base in cls.__mro__:
+        names |= vars(base).keys()
+    return names
+
+@functools.cache
+def _get_tool():
+    """构建共享的工具实例：电话本加载等初始化开销只付一次"""
+    from main import MobileControlTool
+
+    return MobileControlTool()
+
+# Dify的BuiltinTool基类在模块加载时解析一次；本地环境没装Dify时为None，
+# 子类检查直接跳过，避免每次测试都走一遍import机制
+try:
+    from core.tools.tool.builtin_tool import BuiltinTool as _BUILTIN_TOOL  # type: ignore
+except ImportError:
+    _BUILTIN_TOOL = None
+
+# 测试用手机号的校验正则，模块加载时编译一次
+_PHONE_RE = re.compile(r'^\d{11}$')
+
+@contextmanager
+def _temp_contact(tool, name, phone, alias=""):
+    """测试联系人的上下文管理器：进入时添加，退出时清理"""
+    with suppress(Exception):
+        tool.phonebook_delete(name)  # 清理上次运行可能遗留的数据
+    result = tool.phonebook_add(name, phone, alias)
+    try:
+        yield result
+    finally:
+        with suppress(Exception):
+            tool.phonebook_delete(name)
+
 def test_yaml_config():
     """测试YAML配置文件"""
-    print("🧪 测试YAML配置文件...")
+    _reporter.write("🧪 测试YAML配置文件...")
 
     try:
-        with open('_assets.yaml', 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+        config = _cached_yaml_load('_assets.yaml')
 
         # 检查必需字段
-        required_fields = [
-            'openapi',
-            'info',
-            'paths'
-        ]
-
-        for field in required_fields:
-            if field not in config:
-                print(f"❌ 缺少必需字段: {field}")
-                return False
-
-        # 检查openapi版本
-        if not isinstance(config['openapi'], str):
-            print("❌ openapi字段必须是字符串")
+        missing = _REQUIRED_FIELDS - config.keys()
+        if missing:
+            _reporter.write(f"❌ 缺少必需字段: {', '.join(sorted(missing))}")
             return False
 
-        # 检查info字段
-        info = config['info']
-        if not isinstance(info, dict):
-            print("❌ info字段必须是对象")
-            return False
-
-        required_info_fields = ['title', 'description', 'version']
-
-        for field in required_info_fields:
-            if field not in info:
-                print(f"❌ info缺少字段: {field}")
+        # 按声明式校验表检查顶层字段类型
+        for field, expected_type, require_nonempty, error_message in _TOP_LEVEL_SPEC:
+            value = config[field]
+            if not isinstance(value, expected_type) or (require_nonempty and not value):
+                _reporter.write(error_message)
                 return False
 
-        # 检查paths字段
-        paths = config['paths']
-        if not isinstance(paths, dict) or not paths:
-            print("❌ paths必须是非空对象")
+        missing = _REQUIRED_INFO_FIELDS - config['info'].keys()
+        if missing:
+            _reporter.write(f"❌ info缺少字段: {', '.join(sorted(missing))}")
             return False
 
+        paths = config['paths']
+
         # 检查每个路径的定义
         for path, methods in paths.items():
             if not isinstance(methods, dict) or not methods:
-                print(f"❌ 路径 '{path}' 必须包含至少一个方法")
+                _reporter.write(f"❌ 路径 '{path}' 必须包含至少一个方法")
                 return False
 
             for method, definition in methods.items():
                 if not isinstance(definition, dict):
-                    print(f"❌ 路径 '{path}' 的方法 '{method}' 定义必须是对象")
-                    return False
-                if 'operationId' not in definition:
-                    print(f"❌ 路径 '{path}' 的方法 '{method}' 缺少operationId")
+                    _reporter.write(f"❌ 路径 '{path}' 的方法 '{method}' 定义必须是对象")
                     return False
-                if 'responses' not in definition:
-                    print(f"❌ 路径 '{path}' 的方法 '{method}' 缺少responses定义")
+                missing = _REQUIRED_METHOD_FIELDS - definition.keys()
+                if missing:
+                    _reporter.write(f"❌ 路径 '{path}' 的方法 '{method}' 缺少字段: {', '.join(sorted(missing))}")
                     return False
 
         # 检查components.schemas
         components = config.get('components', {})
         schemas = components.get('schemas', {})
-        required_schemas = ['MobileControlRequest', 'MobileControlResponse']
-        for schema_name in required_schemas:
-            if schema_name not in schemas:
-                print(f"❌ 缺少schema定义: {schema_name}")
-                return False
+        missing = _REQUIRED_SCHEMAS - schemas.keys()
+        if missing:
+            _reporter.write(f"❌ 缺少schema定义: {', '.join(sorted(missing))}")
+            return False
 
-        print("✅ YAML配置文件验证通过")
+        _reporter.write("✅ YAML配置文件验证通过")
         return True
 
     except Exception as e:
-        print(f"❌ YAML配置文件测试失败: {e}")
+        _reporter.write(f"❌ YAML配置文件测试失败: {e}")
         return False
+    finally:
+        _reporter.flush()
 
 def test_main_script():
     """测试主脚本"""
-    print("🧪 测试主脚本...")
+    _reporter.write("🧪 测试主脚本...")
 
     try:
         # 导入主模块
         import main
 
         # 检查MobileControlTool类是否存在
-        if not hasattr(main, 'MobileControlTool'):
-            print("❌ 缺少MobileControlTool类")
+        # getattr带默认值在属性缺失时不构造AttributeError，比hasattr更快
+        if getattr(main, 'MobileControlTool', None) is None:
+            _reporter.write("❌ 缺少MobileControlTool类")
             return False
 
-        # 创建工具实例
-        tool = main.MobileControlTool()
-
-        # 测试基本方法
-        methods_to_test = [
-            'phonebook_list',
-            'phonebook_add',
-            'phonebook_delete',
-            'make_call',
-            'send_sms',
-            'control_volume',
-            'control_brightness',
-            'control_theme',
-            '_invoke'  # Dify工具必需的方法
-        ]
-
-        for method_name in methods_to_test:
-            if not hasattr(tool, method_name):
-                print(f"❌ 缺少方法: {method_name}")
-                return False
+        # 装了Dify时校验继承关系（基类在模块加载时已缓存）
+        if _BUILTIN_TOOL is not None and not issubclass(main.MobileControlTool, _BUILTIN_TOOL):
+            _reporter.write("❌ MobileControlTool必须继承BuiltinTool")
+            return False
 
-        print("✅ 主脚本验证通过")
+        # 创建工具实例（与test_tool_functionality共享同一个缓存实例）
+        _get_tool()
+
+        # 测试基本方法：一次MRO遍历加集合差集，替代逐个属性查找
+        missing = _REQUIRED_TOOL_METHODS - _mro_names(main.MobileControlTool)
+        if missing:
+            _reporter.write(f"❌ 缺少方法: {', '.join(sorted(missing))}")
+            return False
+
+        _reporter.write("✅ 主脚本验证通过")
         return True
 
     except Exception as e:
-        print(f"❌ 主脚本测试失败: {e}")
+        _reporter.write(f"❌ 主脚本测试失败: {e}")
         return False
+    finally:
+        _reporter.flush()
 
 def test_api_server():
     """测试API服务器"""
-    print("🧪 测试API服务器导入...")
+    _reporter.write("🧪 测试API服务器导入...")
+
+    # 先确认Flask可导入，避免为注定失败的导入支付完整的import机制开销
+    if importlib.util.find_spec('flask') is None:
+        _reporter.write("❌ 未安装Flask，无法导入API服务器")
+        _reporter.write("   请确保安装了所需的依赖: pip install -r requirements.txt")
+        _reporter.flush()
+        return False
 
     try:
         # 尝试导入API服务器模块
         import api_server
 
         # 检查Flask应用是否存在
-        if not hasattr(api_server, 'app'):
-            print("❌ API服务器缺少app对象")
+        if getattr(api_server, 'app', None) is None:
+            _reporter.write("❌ API服务器缺少app对象")
             return False
 
-        print("✅ API服务器验证通过")
+        _reporter.write("✅ API服务器验证通过")
         return True
 
     except ImportError as e:
-        print(f"❌ API服务器导入失败: {e}")
-        print("   请确保安装了所需的依赖: pip install -r requirements.txt")
+        _reporter.write(f"❌ API服务器导入失败: {e}")
+        _reporter.write("   请确保安装了所需的依赖: pip install -r requirements.txt")
         return False
     except Exception as e:
-        print(f"❌ API服务器测试失败: {e}")
+        _reporter.write(f"❌ API服务器测试失败: {e}")
         return False
+    finally:
+        _reporter.flush()
 
 def test_tool_functionality():
     """测试工具功能"""
-    print("🧪 测试工具功能...")
+    _reporter.write("🧪 测试工具功能...")
 
     try:
-        from main import MobileControlTool
-
-        tool = MobileControlTool()
-
-        # 先清理可能存在的测试数据
-        try:
-            tool.phonebook_delete("测试联系人")
-        except:
-            pass  # 忽略删除失败
+        tool = _get_tool()
 
         # 测试电话本功能
         result = tool.phonebook_list()
         if not result.get('success', False):
-            print(f"❌ 电话本功能测试失败: {result.get('message', 'unknown error')}")
+            _reporter.write(f"❌ 电话本功能测试失败: {result.get('message', 'unknown error')}")
             return False
 
-        # 测试添加联系人
-        result = tool.phonebook_add("测试联系人", "13800138000", "测试别名")
-        if not result.get('success', False):
-            print(f"❌ 添加联系人功能测试失败: {result.get('message', 'unknown error')}")
+        # 测试添加联系人（号码先过预编译的正则，退出时自动清理）
+        phone = "13800138000"
+        if _PHONE_RE.match(phone) is None:
+            _reporter.write(f"❌ 测试号码格式不正确: {phone}")
             return False
 
-        # 清理测试数据
-        try:
-            tool.phonebook_delete("测试联系人")
-        except:
-            pass  # 忽略删除失败
+        with _temp_contact(tool, "测试联系人", phone, "测试别名") as result:
+            if not result.get('success', False):
+                _reporter.write(f"❌ 添加联系人功能测试失败: {result.get('message', 'unknown error')}")
+                return False
 
         # 测试_invoke方法
         try:
             result = tool._invoke("test_user", {"action": "phonebook_list"})
             if not isinstance(result, list) or len(result) == 0:
-                print("❌ _invoke方法返回格式不正确")
+                _reporter.write("❌ _invoke方法返回格式不正确")
                 return False
         except Exception as e:
-            print(f"❌ _invoke方法测试失败: {e}")
+            _reporter.write(f"❌ _invoke方法测试失败: {e}")
             return False
 
-        print("✅ 工具功能验证通过")
+        _reporter.write("✅ 工具功能验证通过")
         return True
 
     except Exception as e:
-        print(f"❌ 工具功能测试失败: {e}")
+        _reporter.write(f"❌ 工具功能测试失败: {e}")
         return False
+    finally:
+        _reporter.flush()
 
 def main():
     """主测试函数"""